@@ -28,3 +28,4 @@ Scripts for our bot framework
 from jogobot.jogobot import ( output, sendmail, is_active )  # noqa
 from jogobot.config import config  # noqa
 import jogobot.bot as bot  # noqa
+import jogobot.report as report  # noqa
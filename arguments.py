@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  arguments.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Declarative registry for task specific cmd args, as faster alternative to
+the callback of bot.parse_local_args()
+"""
+
+
+class ArgumentRegistry:
+    """
+    Holds task specific args, filled once by the task
+
+    Usage:
+        registry = ArgumentRegistry()
+        registry.register( "-limit", type=int )
+        registry.register( "-force", flag=True )
+        registry.register( "-skip", key="skip_titles", multiple=True )
+
+        ( subtask, genFactory, kwargs ) = jogobot.bot.parse_local_args(
+            local_args, registry=registry )
+
+    Args are looked up by exact name in a dict. If bulk_pages is True,
+    all "-page:title" args are combined into one preloading generator.
+    """
+
+    def __init__( self, bulk_pages=True ):
+        """
+        Initialise our class
+
+        @param  bulk_pages  Combine "-page" args into a single generator
+        @type  bulk_pages  bool
+        """
+        self.bulk_pages = bulk_pages
+
+        # argkey -> ( key, type, flag, multiple )
+        self.args = dict()
+
+        # Defaults for kwargs
+        self.defaults = dict()
+
+    def register( self, arg, key=None, type=str, flag=False, multiple=False,
+                  default=None ):
+        """
+        Registers an arg
+
+        @param  arg  Arg name including leading dash, e.g. "-limit"
+        @type  arg  str
+        @param  key  Key in kwargs, default is arg without leading dash
+        @type  key  str
+        @param  type  Callable to convert value, e.g. int
+        @type  type  callable
+        @param  flag  Arg has no value, True is stored if given
+        @type  flag  bool
+        @param  multiple  Arg could be given several times, values are
+                          collected in a list
+        @type  multiple  bool
+        @param  default  Value stored in kwargs if arg is not given,
+                         None to omit key. Must be a list or tuple if
+                         multiple is True
+        @raises  TypeError  If default of multiple arg is no list or tuple
+        """
+        key = key or arg.lstrip( "-" )
+
+        if multiple and default is not None and \
+                not isinstance( default, ( list, tuple ) ):
+            raise TypeError( (
+                "Default of multiple arg \"{arg}\" must be a list or " +
+                "tuple!" ).format( arg=arg ) )
+
+        self.args[arg] = ( key, type, flag, multiple )
+
+        if default is not None:
+            self.defaults[key] = default
+
+    def initial_kwargs( self ):
+        """
+        Returns new kwargs dict filled with defaults
+
+        Defaults of multiple args are copied, so collected values never
+        change the registry.
+
+        @rtype  dict
+        """
+        kwargs = dict()
+
+        for arg, ( key, type, flag, multiple ) in self.args.items():
+            if key in self.defaults:
+                if multiple:
+                    kwargs[key] = list( self.defaults[key] )
+                else:
+                    kwargs[key] = self.defaults[key]
+
+        return kwargs
+
+    def __contains__( self, arg ):
+        """
+        Checks if arg is registered
+        """
+        return arg in self.args
+
+    def handle( self, kwargs, arg, value ):
+        """
+        Converts value of registered arg and stores it in kwargs
+
+        @param  kwargs  Dict to store value in
+        @type  kwargs  dict
+        @param  arg  Registered arg name
+        @type  arg  str
+        @param  value  Raw value (part after ":")
+        @type  value  str
+
+        @raises  ValueError  If value could not be converted
+        """
+        key, type, flag, multiple = self.args[arg]
+
+        if flag:
+            value = True
+        else:
+            try:
+                value = type( value )
+            except ( TypeError, ValueError ):
+                raise ValueError( (
+                    "Invalid value \"{value}\" for arg \"{arg}\"!" ).format(
+                        value=value, arg=arg ) )
+
+        if multiple:
+            kwargs.setdefault( key, [] ).append( value )
+        else:
+            kwargs[key] = value
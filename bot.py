@@ -30,6 +30,10 @@ import sys
 from pywikibot import pagegenerators
 
 import jogobot
+from jogobot import report
+from jogobot.pipeline import Pipeline
+from jogobot.shard import ShardedGeneratorFactory, JobQueue, parse_shard
+from jogobot.arguments import ArgumentRegistry  # noqa
 
 
 def active(task_slug):
@@ -51,12 +55,14 @@ def active(task_slug):
         (type, value, traceback) = sys.exc_info()
         jogobot.output( "\03{lightpurple} %s (%s)" % (value, type ),
                         "CRITICAL" )
+        report.add( None, "blocked", str( value ).strip() )
         return False
 
     except jogobot.jogobot.Disabled:
         (type, value, traceback) = sys.exc_info()
         jogobot.output( "\03{red} %s (%s)" % (value, type ),
                         "ERROR" )
+        report.add( None, "disabled", str( value ).strip() )
         return False
 
     # Bot/Task is active
@@ -64,7 +70,7 @@ def active(task_slug):
         return True
 
 
-def parse_local_args( local_args, callback=None ):
+def parse_local_args( local_args, callback=None, registry=None ):
     """
     Parses local cmd args which are not parsed by pywikibot
 
@@ -78,6 +84,23 @@ def parse_local_args( local_args, callback=None ):
                       Or if arg is not relevant, return None or False. Then the
                       arg will be passed to genFactory.handleArg()
     @type  callable
+    @param  registry  Registry of task specific args, looked up before all
+                      other args. Faster alternative to callback, which
+                      could also combine "-page" args into one preloading
+                      generator, placed where the first "-page" arg was
+                      given. As these pages are preloaded before filters
+                      like "-ns" or "-limit" apply, use those with care and
+                      note that getCombinedGenerator( preload=True ) is
+                      redundant for them
+    @type  jogobot.arguments.ArgumentRegistry
+
+    Besides "-always" and "-task" the following args are handled:
+        -shard:i/n  Only work on pages of shard i (zero-based) of n,
+                    determined by title hash
+        -jobqueue:file  Lease pages from SQLite job queue in file. The first
+                        worker fills the queue with its pages, so several
+                        processes on this host could work on them in
+                        parallel. File must be on a local filesystem
 
     @returns  The following tuple
         @return 1  Slug of given subtask (Arg "-task")
@@ -92,7 +115,7 @@ def parse_local_args( local_args, callback=None ):
     # This factory is responsible for processing command line arguments
     # that are also used by other scripts and that determine on which pages
     # to work on.
-    genFactory = pagegenerators.GeneratorFactory()
+    genFactory = ShardedGeneratorFactory()
 
     # If always is True, bot won't ask for confirmation of edit (automode)
     # always = False
@@ -108,16 +131,51 @@ def parse_local_args( local_args, callback=None ):
     # kwargs are passed to selected bot as **kwargs
     kwargs = dict()
 
+    # Titles of "-page" args, if combined by registry
+    titles = []
+
+    # Position of generator for "-page" args in genFactory.gens
+    titles_index = None
+
+    if registry:
+        kwargs.update( registry.initial_kwargs() )
+
     # Parse command line arguments
     for arg in local_args:
 
         # Split args
         argkey, sep, value = arg.partition(':')
 
-        if argkey.startswith("-always"):
+        if registry and argkey in registry:
+            try:
+                registry.handle( kwargs, argkey, value )
+            except ValueError:
+                (type, value, traceback) = sys.exc_info()
+                jogobot.output( "\03{red} %s" % value, "ERROR" )
+                raise
+        elif registry and registry.bulk_pages and argkey == "-page" and value:
+            if titles_index is None:
+                titles_index = len( genFactory.gens )
+            titles.append( value )
+        elif argkey.startswith("-always"):
             kwargs['always'] = True
         elif argkey.startswith("-task"):
             subtask = value
+        elif argkey.startswith("-shard"):
+            try:
+                genFactory.shard = parse_shard( value )
+            except ValueError:
+                (type, value, traceback) = sys.exc_info()
+                jogobot.output( "\03{red} %s" % value, "ERROR" )
+                raise
+        elif argkey.startswith("-jobqueue"):
+            # Empty path would give each worker its own temporary database
+            if not value:
+                jogobot.output( "\03{red} Arg \"-jobqueue\" needs a file!",
+                                "ERROR" )
+                raise ValueError( "Arg \"-jobqueue\" needs a file!" )
+
+            genFactory.jobqueue = JobQueue( value )
 
         # Must be the last but one entry
         elif callable(callback):
@@ -132,6 +190,13 @@ def parse_local_args( local_args, callback=None ):
         else:
             genFactory.handleArg(arg)
 
+    # Combine all "-page" args into one generator, keeping arg order
+    if titles:
+        genFactory.gens.insert(
+            titles_index, pagegenerators.PreloadingGenerator(
+                pagegenerators.PagesFromTitlesGenerator( titles,
+                                                         genFactory.site ) ) )
+
     # Return Tuple
     return ( subtask, genFactory, kwargs )
 
@@ -217,6 +282,7 @@ def init_bot( task_slug, subtask, Bot, genFactory, **kwargs ):
             "\03{{red}} Error while trying to init " +
             "subtask \"{task_slug}-{subtask}\"!" ).
             format( task_slug=task_slug, subtask=subtask ), "ERROR" )
+        report.add( subtask, "init failed", repr( sys.exc_info()[1] ) )
         raise
     else:
         # Init successfull
@@ -254,15 +320,17 @@ def run_bot( task_slug, subtask, bot ):
         (type, value, traceback) = sys.exc_info()
 
         # Catch missing run()-method
-        if "has no attribute 'run'" in value:
+        if "has no attribute 'run'" in str( value ):
             jogobot.output( (
                 "\03{{red}} Error while trying to run " +
                 "subtask \"{task_slug}-{subtask} \": +"
                 "Run-method is missing! ").
                 format( task_slug=task_slug, subtask=subtask ), "ERROR" )
+            report.add( subtask, "failed", "Run-method is missing!" )
 
         # Pass through other AttributeError
         else:
+            report.add( subtask, "failed", repr( value ) )
             raise
 
     except:
@@ -270,6 +338,7 @@ def run_bot( task_slug, subtask, bot ):
             "\03{{red}} Error while trying to run " +
             "subtask \"{task_slug}-{subtask} \"!" ).
             format( task_slug=task_slug, subtask=subtask ), "ERROR" )
+        report.add( subtask, "failed", repr( sys.exc_info()[1] ) )
         raise
 
     else:
@@ -277,3 +346,29 @@ def run_bot( task_slug, subtask, bot ):
         jogobot.output( (
             "Subtask \"{task_slug}-{subtask}\" was finished successfully").
             format(task_slug=task_slug, subtask=subtask) )
+        report.add( subtask, "finished" )
+
+
+def pipeline( genFactory, maxsize=100, **kwargs ):
+    """
+    Creates a streaming Pipeline with the combined generator of genFactory
+    as source, so huge page sets could be processed with bounded memory
+
+    Add stages with filter(), map() and sink() and start with run().
+
+    @param  genFactory  GenFactory with parsed pagegenerator args
+    @type  genFactory  pagegenerators.GeneratorFactory
+    @param  maxsize  Maximum count of pages waiting between two stages
+    @type  maxsize  int
+    @param  **kwargs  Additional args for genFactory.getCombinedGenerator()
+    @type  **kwargs  dict
+
+    @returns  Pipeline with pages as source
+    @rtype  jogobot.pipeline.Pipeline
+    """
+    generator = genFactory.getCombinedGenerator( **kwargs )
+
+    if generator is None:
+        generator = iter( () )
+
+    return Pipeline( generator, maxsize, name="pages" )
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  forkserver.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Fork-server to avoid interpreter startup, imports and login for each run
+
+A resident server process imports pywikibot and jogobot and logs in once.
+For each run request received via Unix socket it forks a child, which calls
+the main function of the task with the given args. The client passes its
+stdout and stderr along with the request, so the child writes to them
+directly. Only the exit code is sent back via socket.
+
+Requests have to be sent within REQUEST_TIMEOUT seconds, otherwise they are
+dropped, so a stalled client does not block other runs. If the client goes
+away (e.g. killed by a cron timeout), the child notices the closed socket
+and interrupts the task with KeyboardInterrupt.
+
+Server, in the task script:
+    jogobot.forkserver.serve( "/path/to/task.sock", main )
+
+Client, e.g. from cron (as script, so neither pywikibot nor jogobot are
+imported):
+    python3 /path/to/jogobot/forkserver.py /path/to/task.sock -task:foo
+
+Needs pywikibot 3.0 or newer, as the threaded http layer of pywikibot 2.0
+would not survive fork. serve() refuses to start otherwise.
+"""
+
+import os
+import sys
+import json
+import array
+import signal
+import socket
+import threading
+import traceback
+
+# Seconds a client has to send its request
+REQUEST_TIMEOUT = 5
+
+
+def serve( socket_path, main ):
+    """
+    Preloads pywikibot and jogobot, logs in and handles run requests
+
+    Does not return.
+
+    @param  socket_path  Path of Unix socket to listen on
+    @type  socket_path  str
+    @param  main  Main function of task, gets args as list like sys.argv[1:]
+    @type  main  callable
+
+    @raises  ForkServerError  If pywikibot uses http threads
+    """
+    # Imports are done here, so using this module as client stays cheap
+    import pywikibot
+    import jogobot
+
+    _check_pywikibot()
+
+    site = pywikibot.Site()
+    site.login()
+
+    # Remove stale socket of previous server
+    if os.path.exists( socket_path ):
+        os.unlink( socket_path )
+
+    listener = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+
+    # Only we may connect, from the beginning on
+    umask = os.umask( 0o077 )
+    try:
+        listener.bind( socket_path )
+    finally:
+        os.umask( umask )
+
+    listener.listen( 16 )
+    listener.settimeout( 1 )
+
+    jogobot.output( "Fork-server listening on \"{path}\"".format(
+        path=socket_path ) )
+
+    while True:
+        _reap()
+
+        try:
+            conn, address = listener.accept()
+        except socket.timeout:
+            continue
+
+        fds = []
+
+        try:
+            conn.settimeout( REQUEST_TIMEOUT )
+            request, fds = _read_request( conn )
+            conn.settimeout( None )
+        except socket.timeout:
+            jogobot.output( "\03{red} Invalid fork-server request: " +
+                            "Timed out", "ERROR" )
+            conn.close()
+            continue
+        except ( OSError, ValueError ):
+            (type, value, traceback) = sys.exc_info()
+            jogobot.output( "\03{red} Invalid fork-server request: %s" %
+                            value, "ERROR" )
+            conn.close()
+            for fd in fds:
+                os.close( fd )
+            continue
+
+        # Do not pass open http connections to children
+        _reset_http()
+
+        pid = os.fork()
+
+        if pid == 0:
+            listener.close()
+            _child( conn, request, fds, main )
+
+        conn.close()
+
+        for fd in fds:
+            os.close( fd )
+
+
+def _check_pywikibot():
+    """
+    Makes sure pywikibot does not use http threads, which would not exist
+    in forked children
+
+    @raises  ForkServerError  If pywikibot uses http threads
+    """
+    from pywikibot.comms import http
+
+    if hasattr( http, "http_queue" ) or hasattr( http, "threads" ):
+        raise ForkServerError(
+            "Fork-server needs pywikibot 3.0 or newer, the threaded http " +
+            "layer of this version would hang in forked children!" )
+
+
+def _read_request( conn ):
+    """
+    Reads a single json encoded request line and stdout/stderr of client
+    passed as file descriptors from conn
+
+    @return  Tuple of request (dict with keys "args" and "cwd") and list of
+             file descriptors
+    @rtype  tuple
+    """
+    data = b""
+    fds = array.array( "i" )
+
+    try:
+        while not data.endswith( b"\n" ):
+            chunk, ancdata, flags, address = conn.recvmsg(
+                65536, socket.CMSG_LEN( 2 * fds.itemsize ) )
+
+            for level, type, cmsg_data in ancdata:
+                if level == socket.SOL_SOCKET and \
+                        type == socket.SCM_RIGHTS:
+                    fds.frombytes( cmsg_data[ :len( cmsg_data ) -
+                                              ( len( cmsg_data ) %
+                                                fds.itemsize ) ] )
+
+            if not chunk:
+                raise ValueError( "Connection closed before end of request" )
+
+            data += chunk
+
+    # Do not leak already received file descriptors
+    except:
+        for fd in fds:
+            os.close( fd )
+        raise
+
+    fds = list( fds )
+
+    if len( fds ) != 2:
+        for fd in fds:
+            os.close( fd )
+        raise ValueError( "Request has not passed stdout and stderr" )
+
+    try:
+        request = json.loads( data.decode( "utf-8" ) )
+
+        if not isinstance( request.get( "args" ), list ):
+            raise ValueError( "Request has no args list" )
+    except ValueError:
+        for fd in fds:
+            os.close( fd )
+        raise
+
+    return ( request, fds )
+
+
+def _reset_http():
+    """
+    Closes connection pools of pywikibot http session, cookies are kept
+    """
+    try:
+        from pywikibot.comms import http
+        http.session.close()
+    except ( ImportError, AttributeError ):
+        pass
+
+
+def _restart_put_thread():
+    """
+    Replaces pywikibot thread for asynchronous page saves if it was started
+    in server, as threads do not survive fork
+    """
+    import pywikibot
+
+    putthread = getattr( pywikibot, "_putthread", None )
+
+    if putthread is not None and putthread.ident is not None and \
+            not putthread.is_alive():
+        pywikibot._putthread = threading.Thread(
+            target=pywikibot.async_manager, name=putthread.name )
+        pywikibot._putthread.daemon = True
+        pywikibot._putthread.start()
+
+
+def _watch_client( conn ):
+    """
+    Interrupts main thread with KeyboardInterrupt as soon as client has
+    closed the connection, as nobody waits for the run anymore
+    """
+    try:
+        # Client sends nothing after request, so this returns only at EOF
+        conn.recv( 1 )
+    except OSError:
+        pass
+
+    os.kill( os.getpid(), signal.SIGINT )
+
+
+def _reap():
+    """
+    Collects exit status of terminated children
+    """
+    try:
+        while os.waitpid( -1, os.WNOHANG )[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+
+def _child( conn, request, fds, main ):
+    """
+    Runs main in forked child with stdout and stderr of client
+
+    Does not return.
+    """
+    import pywikibot
+    import jogobot
+
+    code = 1
+
+    try:
+        # Connect std streams to client
+        os.dup2( fds[0], 1 )
+        os.dup2( fds[1], 2 )
+
+        for fd in fds:
+            os.close( fd )
+
+        with open( os.devnull ) as devnull:
+            os.dup2( devnull.fileno(), 0 )
+
+        if request.get( "cwd" ):
+            os.chdir( request["cwd"] )
+
+        sys.argv = sys.argv[0:1] + request["args"]
+
+        _restart_put_thread()
+
+        threading.Thread( target=_watch_client, args=( conn, ),
+                          daemon=True ).start()
+
+        try:
+            main( request["args"] )
+            code = 0
+        except SystemExit:
+            (type, value, tb) = sys.exc_info()
+            if value.code is None:
+                code = 0
+            elif isinstance( value.code, int ):
+                code = value.code
+            else:
+                print( value.code, file=sys.stderr )
+                code = 1
+        except:
+            traceback.print_exc()
+            code = 1
+
+        # Do what atexit would do, as we leave with os._exit()
+        jogobot.jogobot.run_exit_hooks()
+        pywikibot.stopme()
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        conn.sendall( str( code ).encode( "ascii" ) )
+
+    finally:
+        os._exit( code )
+
+
+def call( socket_path, args, cwd=None ):
+    """
+    Sends run request to fork-server, output of run goes to our stdout and
+    stderr
+
+    @param  socket_path  Path of Unix socket of server
+    @type  socket_path  str
+    @param  args  Args for main function of task
+    @type  args  list
+    @param  cwd  Working directory for run, default is current one
+    @type  cwd  str
+
+    @return  Exit code of run, 1 if it was not reported
+    @rtype  int
+    """
+    request = { "args": list( args ), "cwd": cwd or os.getcwd() }
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    conn = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    conn.connect( socket_path )
+
+    with conn:
+        data = json.dumps( request ).encode( "utf-8" ) + b"\n"
+        fds = array.array( "i", [ sys.stdout.fileno(), sys.stderr.fileno() ] )
+
+        # Pass stdout and stderr with first part of request
+        sent = conn.sendmsg( [ data ], [ ( socket.SOL_SOCKET,
+                                           socket.SCM_RIGHTS,
+                                           fds.tobytes() ) ] )
+        conn.sendall( data[sent:] )
+
+        code = b""
+
+        while True:
+            chunk = conn.recv( 64 )
+
+            if not chunk:
+                break
+
+            code += chunk
+
+    try:
+        return int( code )
+    except ValueError:
+        return 1
+
+
+class ForkServerError( Exception ):
+    """
+    Raised if fork-server could not be started
+    """
+    pass
+
+
+if __name__ == "__main__":
+    if len( sys.argv ) < 2:
+        print( "Usage: forkserver.py SOCKET [ARGS...]", file=sys.stderr )
+        sys.exit( 2 )
+
+    sys.exit( call( sys.argv[1], sys.argv[2:] ) )
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  jobqueue.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+SQLite backed job queue to distribute page titles across several worker
+processes on one host
+
+Only depends on the standard library. Run this module directly for a self
+test with several local worker processes, one of them killed mid-lease.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+
+class JobQueue:
+    """
+    SQLite backed queue of page titles, which could be leased in chunks by
+    several worker processes on the same host
+
+    The file must be on a local filesystem. Leasing relies on SQLite file
+    locking, which is unreliable on network filesystems like NFS and could
+    hand out a job twice there. To spread a run across hosts, use static
+    shards ("-shard:i/n") per host instead.
+
+    Leases expire after lease_time seconds unless renewed, so chunks of
+    crashed workers are handed out again. The filling worker keeps a
+    heartbeat, if it stops for lease_time seconds before filling is finished,
+    waiting workers raise JobQueueError and the queue file has to be removed
+    to start over.
+
+    Each thread (and process) uses its own SQLite connection, opened on first
+    use, so the queue could be consumed e.g. in a pipeline stage thread.
+    """
+
+    def __init__( self, path, lease_time=600, chunk_size=100, poll=5 ):
+        """
+        Initialise our class
+
+        @param  path  SQLite file of queue, created if not existing
+        @type  path  str
+        @param  lease_time  Seconds until a lease expires
+        @type  lease_time  int
+        @param  chunk_size  Count of titles per job
+        @type  chunk_size  int
+        @param  poll  Seconds to wait before retrying if no job is leasable
+        @type  poll  int
+        """
+        self.path = path
+        self.lease_time = lease_time
+        self.chunk_size = chunk_size
+        self.poll = poll
+
+        # Connections per thread
+        self._local = threading.local()
+
+    @property
+    def db( self ):
+        """
+        Returns SQLite connection of current thread, opened on first use
+
+        @rtype  sqlite3.Connection
+        """
+        # Connections must neither be shared between threads nor inherited
+        # by forked processes
+        if getattr( self._local, "pid", None ) != os.getpid():
+            # Autocommit, we manage transactions on our own
+            self._local.db = sqlite3.connect( self.path, timeout=60,
+                                              isolation_level=None )
+            self._local.pid = os.getpid()
+            self._create( self._local.db )
+
+        return self._local.db
+
+    def _create( self, db ):
+        """
+        Creates tables if not existing
+        """
+        db.executescript( """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                titles TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                expires REAL );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT ); """ )
+
+    def claim_filling( self, worker ):
+        """
+        Atomically claims the right to fill the queue
+
+        @return  True if worker has to fill the queue, otherwise False
+        @rtype  bool
+        """
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO meta VALUES ( 'filler', ? )", ( worker, ) )
+
+        if cursor.rowcount == 1:
+            self._heartbeat()
+            return True
+
+        return False
+
+    def _heartbeat( self ):
+        """
+        Signals that filling worker is still alive
+        """
+        self.db.execute( "INSERT OR REPLACE INTO meta VALUES " +
+                         "( 'heartbeat', ? )", ( time.time(), ) )
+
+    def filler_alive( self ):
+        """
+        Checks if filling worker has signaled to be alive within lease_time
+
+        @return  None if no worker has claimed filling yet, otherwise bool
+        @rtype  bool
+        """
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = 'heartbeat'" ).fetchone()
+
+        if row is None:
+            return None
+
+        return time.time() - float( row[0] ) < self.lease_time
+
+    def fill( self, titles ):
+        """
+        Adds titles in chunks of chunk_size and marks queue as filled
+
+        @param  titles  Page titles to add
+        @type  titles  iterable
+        """
+        chunk = []
+
+        for title in titles:
+            chunk.append( title )
+
+            if len( chunk ) >= self.chunk_size:
+                self._add_job( chunk )
+                chunk = []
+
+        if chunk:
+            self._add_job( chunk )
+
+        self.db.execute( "INSERT OR REPLACE INTO meta VALUES ( 'filled', 1 )" )
+
+    def _add_job( self, titles ):
+        """
+        Adds a single job with given titles
+        """
+        self.db.execute( "INSERT INTO jobs ( titles ) VALUES ( ? )",
+                         ( "\n".join( titles ), ) )
+        self._heartbeat()
+
+    def is_filled( self ):
+        """
+        Checks if filling of queue was finished
+        """
+        return self.db.execute(
+            "SELECT 1 FROM meta WHERE key = 'filled'" ).fetchone() is not None
+
+    def lease( self, worker ):
+        """
+        Leases next pending job or one with expired lease
+
+        @return  Tuple of job id and list of titles or None if no job is
+                 leasable at the moment
+        @rtype  tuple
+        """
+        now = time.time()
+
+        # Lock database for writing, so no one else can lease the same job
+        self.db.execute( "BEGIN IMMEDIATE" )
+
+        try:
+            row = self.db.execute(
+                "SELECT id, titles FROM jobs WHERE state = 'pending' OR " +
+                "( state = 'leased' AND expires < ? ) ORDER BY id LIMIT 1",
+                ( now, ) ).fetchone()
+
+            if row:
+                self.db.execute(
+                    "UPDATE jobs SET state = 'leased', worker = ?, " +
+                    "expires = ? WHERE id = ?",
+                    ( worker, now + self.lease_time, row[0] ) )
+        except:
+            self.db.execute( "ROLLBACK" )
+            raise
+        else:
+            self.db.execute( "COMMIT" )
+
+        if row:
+            return ( row[0], row[1].split( "\n" ) )
+
+        return None
+
+    def renew( self, job_id, worker ):
+        """
+        Renews lease of job
+
+        @return  False if lease was lost to another worker, otherwise True
+        @rtype  bool
+        """
+        cursor = self.db.execute(
+            "UPDATE jobs SET expires = ? WHERE id = ? AND worker = ? AND " +
+            "state = 'leased'",
+            ( time.time() + self.lease_time, job_id, worker ) )
+
+        return cursor.rowcount == 1
+
+    def complete( self, job_id, worker ):
+        """
+        Marks job as done
+        """
+        self.db.execute(
+            "UPDATE jobs SET state = 'done', expires = NULL WHERE id = ? " +
+            "AND worker = ?", ( job_id, worker ) )
+
+    def unfinished( self ):
+        """
+        Returns count of jobs which are not done yet
+        """
+        return self.db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state != 'done'" ).fetchone()[0]
+
+    def titles( self, worker ):
+        """
+        Yields titles of leased jobs until all jobs are done
+
+        Lease is renewed while yielding titles and job is marked as done
+        after its last title was processed (generator is resumed).
+
+        @param  worker  Unique identifier of worker
+        @type  worker  str
+
+        @raises  JobQueueError  If filling worker died or nobody claimed
+                                filling within lease_time
+        """
+        started = time.time()
+
+        while True:
+            job = self.lease( worker )
+
+            if job is None:
+                if self.is_filled():
+                    # Nothing left and nothing to come
+                    if not self.unfinished():
+                        return
+
+                else:
+                    alive = self.filler_alive()
+
+                    if alive is False:
+                        raise JobQueueError(
+                            "Filling worker of job queue \"{path}\" died, "
+                            "remove it to start over!".format(
+                                path=self.path ) )
+
+                    elif alive is None and \
+                            time.time() - started > self.lease_time:
+                        raise JobQueueError(
+                            "Nobody has filled job queue \"{path}\"!".format(
+                                path=self.path ) )
+
+                # Wait for filling or expiring leases
+                time.sleep( self.poll )
+                continue
+
+            job_id, titles = job
+            renewed = time.time()
+
+            for title in titles:
+                # Renew if half of lease time has passed
+                if time.time() - renewed > self.lease_time / 2:
+                    if not self.renew( job_id, worker ):
+                        break
+                    renewed = time.time()
+
+                yield title
+
+            else:
+                self.complete( job_id, worker )
+
+
+class JobQueueError( Exception ):
+    """
+    Raised if job queue could not be processed
+    """
+    pass
+
+
+def _selftest_worker( path, name, victim, leased, output ):
+    """
+    Worker process of selftest, writes processed titles to output
+    """
+    queue = JobQueue( path, lease_time=1, chunk_size=10, poll=0.1 )
+
+    if queue.claim_filling( name ):
+        queue.fill( "Page %d" % index for index in range( 500 ) )
+
+    with open( output, "w" ) as fd:
+        for count, title in enumerate( queue.titles( name ) ):
+            # Victim hangs mid-lease until it is killed
+            if victim and count == 3:
+                leased.set()
+                time.sleep( 3600 )
+
+            fd.write( title + "\n" )
+            fd.flush()
+            time.sleep( 0.005 )
+
+
+def selftest( workers=4 ):
+    """
+    Runs several local worker processes on one queue, kills one of them
+    mid-lease and checks that each title was completed exactly once by the
+    others after its lease has expired
+    """
+    import tempfile
+    import multiprocessing
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join( tmpdir, "queue.sqlite" )
+    leased = multiprocessing.Event()
+
+    outputs = [ os.path.join( tmpdir, "worker%d" % index )
+                for index in range( workers + 1 ) ]
+
+    victim = multiprocessing.Process(
+        target=_selftest_worker,
+        args=( path, "victim", True, leased, outputs[0] ) )
+    victim.start()
+
+    # Victim has filled the queue and holds a lease
+    assert leased.wait( 30 ), "Victim did not lease a job"
+
+    processes = [ multiprocessing.Process(
+        target=_selftest_worker,
+        args=( path, "worker%d" % index, False, leased, outputs[index] ) )
+        for index in range( 1, workers + 1 ) ]
+
+    for process in processes:
+        process.start()
+
+    victim.terminate()
+    victim.join()
+
+    for process in processes:
+        process.join( 120 )
+        assert process.exitcode == 0, "Worker failed"
+
+    titles = []
+
+    for output in outputs[1:]:
+        with open( output ) as fd:
+            titles.extend( fd.read().splitlines() )
+
+    assert sorted( titles ) == sorted( "Page %d" % index
+                                       for index in range( 500 ) ), \
+        "Titles were not completed exactly once"
+    assert not JobQueue( path ).unfinished(), "Unfinished jobs left"
+
+    print( ( "{count} titles completed exactly once by {workers} " +
+             "workers, victim killed mid-lease" ).format(
+                 count=len( titles ), workers=workers ) )
+
+
+if __name__ == "__main__":
+    selftest()
@@ -23,8 +23,12 @@
 #
 
 import os
+import re
 import shlex
+import time
+import atexit
 from datetime import datetime
+from collections import OrderedDict
 from email.mime.text import MIMEText
 from subprocess import Popen, PIPE, TimeoutExpired
 
@@ -42,12 +46,194 @@ except( ImportError ):
         DEBUG, INFO, WARNING, ERROR, CRITICAL, STDOUT, VERBOSE, logoutput )
 
 from jogobot.config import config
+from jogobot import report
+
+
+class OutputRateLimiter:
+    """
+    Limits the number of similar output lines per level and interval
+
+    Configured via "log_ratelimit" in jogobot.conf, which maps a level name
+    to a tuple ( limit, interval[, sample] ), e.g.:
+
+        log_ratelimit = { "INFO": (100, 60), "WARNING": (20, 60, 500) }
+
+    Lines are similar if they have the same template, which is the text with
+    all numbers replaced by "#" or the ratelimit_key given to output().
+    At most limit similar lines are written per interval seconds. Further
+    lines are suppressed, except every sample-th one if sample is given.
+    When the interval has expired (or on exit), a summary line with the
+    count of suppressed lines is written. ERROR and CRITICAL are never
+    suppressed.
+    """
+
+    # Levels which must never be suppressed
+    unlimited = ( "ERROR", "CRITICAL" )
+
+    # Alternative names of levels accepted by output()
+    aliases = { "LOG": "VERBOSE" }
+
+    # Maximum count of tracked templates, oldest ones are dropped first
+    max_windows = 10000
+
+    def __init__( self, limits=None ):
+        """
+        Initialise our class
+
+        @param  limits  Mapping of level name to ( limit, interval[, sample] )
+        @type  limits  dict
+        """
+        self.limits = dict()
+
+        for level, limit in ( limits or dict() ).items():
+            level = self.level_name( level )
+
+            if level not in type(self).unlimited:
+                self.limits[level] = tuple( limit )
+
+        # ( level, template ) -> [ window start, count, suppressed ]
+        # Ordered by window start, as expired windows are re-inserted
+        self.windows = OrderedDict()
+
+        # Time of next check for expired windows
+        self.next_sweep = None
+
+    def level_name( self, level ):
+        """
+        Returns canonical upper case name of level
+        """
+        level = level.upper()
+
+        return type(self).aliases.get( level, level )
+
+    def allow( self, level, text, key=None ):
+        """
+        Checks if given line should be written
+
+        @param  level  Level name of line
+        @type  level  str
+        @param  text  Text of line (without timestamp)
+        @type  text  str
+        @param  key  Template of line, default is text with numbers
+                     replaced by "#"
+        @type  key  str
+
+        @return  True if line should be written, otherwise False
+        @rtype  bool
+        """
+        if not self.limits:
+            return True
+
+        now = time.monotonic()
+
+        # Write summaries of expired windows, also of messages not repeated
+        if self.next_sweep is None or now >= self.next_sweep:
+            self.sweep( now )
+
+        level = self.level_name( level )
+
+        if level not in self.limits:
+            return True
+
+        limit, interval = self.limits[level][0:2]
+
+        if key is None:
+            key = re.sub( r"\d+", "#", text )
+
+        window = self.windows.get( ( level, key ) )
+
+        # New message or expired interval
+        if not window or now - window[0] >= interval:
+            if window:
+                self._close( level, key, window )
+            self._open( level, key, now )
+            return True
+
+        window[1] += 1
+
+        if window[1] <= limit:
+            return True
+
+        # Sampling, let every sample-th line over limit pass
+        if len( self.limits[level] ) > 2 and self.limits[level][2] and \
+                not ( window[1] - limit ) % self.limits[level][2]:
+            return True
+
+        window[2] += 1
+
+        return False
+
+    def _open( self, level, key, now ):
+        """
+        Starts new window, drops oldest ones if there are too many
+        """
+        self.windows[ ( level, key ) ] = [ now, 1, 0 ]
+
+        while len( self.windows ) > self.max_windows:
+            ( _level, _key ), window = self.windows.popitem( last=False )
+            if window[2]:
+                self.summarize( _level, _key, window[2] )
+
+    def _close( self, level, key, window ):
+        """
+        Removes window and writes summary if lines were suppressed
+        """
+        del self.windows[ ( level, key ) ]
+
+        if window[2]:
+            self.summarize( level, key, window[2] )
+
+    def sweep( self, now ):
+        """
+        Removes expired windows, writing summaries for suppressed lines
+        """
+        for ( level, key ), window in list( self.windows.items() ):
+            if now - window[0] >= self.limits[level][1]:
+                self._close( level, key, window )
+
+        self.next_sweep = now + min( limit[1] for limit in
+                                     self.limits.values() )
+
+    def summarize( self, level, key, suppressed ):
+        """
+        Writes summary line for suppressed lines
+        """
+        _output( "Suppressed {count} similar messages: {key}".format(
+            count=suppressed, key=key ), level )
+
+    def flush( self ):
+        """
+        Writes summary lines for all pending suppressed lines
+        """
+        for ( level, key ), window in self.windows.items():
+            if window[2]:
+                self.summarize( level, key, window[2] )
+
+        self.windows = OrderedDict()
 
 
 def output( text, level="INFO", decoder=None, newline=True,
-            layer=None, **kwargs ):
+            layer=None, ratelimit_key=None, **kwargs ):
     """
     Wrapper for pywikibot output functions
+
+    Similar lines are rate limited according to config "log_ratelimit".
+    Lines are considered similar by ratelimit_key if given (e.g. the format
+    string without page title), otherwise by text with numbers replaced.
+    """
+
+    # Drop repetitive lines according to configured rate limits
+    if not ratelimiter.allow( level, text, ratelimit_key ):
+        return
+
+    _output( text, level, decoder, newline, layer, **kwargs )
+
+
+def _output( text, level="INFO", decoder=None, newline=True,
+             layer=None, **kwargs ):
+    """
+    Writes given text with timestamp via pywikibot logging, without rate
+    limiting
     """
 
     text = datetime.utcnow().strftime( config["log_timestamp"] ) + " " + text
@@ -75,6 +261,23 @@ def output( text, level="INFO", decoder=None, newline=True,
         logoutput(text, decoder, newline, _level, **kwargs)
 
 
+# Rate limiter used by output()
+ratelimiter = OutputRateLimiter( config.get( "log_ratelimit" ) )
+
+
+def run_exit_hooks():
+    """
+    Publishes pending run report and writes pending output summaries
+
+    Registered with atexit, has to be called explicitly if process is left
+    via os._exit() (e.g. by fork-server children).
+    """
+    report.publish_at_exit()
+    ratelimiter.flush()
+
+atexit.register( run_exit_hooks )
+
+
 # Since we like to have timestamps in Output for logging, we replace
 # pywikibot.output with jogobot.output via monkey patching
 def pywikibot_output( text, decoder=None, newline=True,
@@ -306,6 +509,14 @@ class StatusAPI:
         with open(disable_file, 'a'):
             pass
 
+    def notify( self, subject, body, mailto ):
+        """
+        Sends status mail or queues it for digest if a run report is
+        collected
+        """
+        if not report.queue_mail( subject, body, mailto ):
+            sendmail( subject, body, mailto )
+
     def blocked( self ):
         """
         Handles process if Bot user is blocked
@@ -316,7 +527,7 @@ class StatusAPI:
         body = """Your Bot-Account is blocked on Wiki"""
         mailto = "jogobot-status@golderweb.de"
 
-        sendmail( subject, body, mailto )
+        self.notify( subject, body, mailto )
 
         raise Blocked( body )
 
@@ -337,7 +548,7 @@ The Bot-Task with slug %s is disabled by file!
             body = """The Bot is disabled by file!"""
             mailto = "jogobot-status@golderweb.de"
 
-        sendmail( subject, body, mailto )
+        self.notify( subject, body, mailto )
 
         raise DisabledByFile( body )
 
@@ -364,7 +575,7 @@ The Bot is disabled by on wiki%s
 """ % suffix
             mailto = "jogobot-status@golderweb.de"
 
-        sendmail( subject, body, mailto )
+        self.notify( subject, body, mailto )
 
         self.create_disable_file( task_slug )
 
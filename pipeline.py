@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  pipeline.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Streaming pipeline to process (huge) page sets with bounded memory
+
+Stages run in own threads and are connected by bounded queues, so a fast
+stage blocks until the following one has catched up (backpressure).
+"""
+
+import sys
+import time
+import queue
+import threading
+
+import jogobot
+
+
+class Pipeline:
+    """
+    Chain of source, filter, map and sink stages
+
+    Usage:
+        Pipeline( generator ).filter( func ).map( func ).sink( func ).run()
+    """
+
+    def __init__( self, source, maxsize=100, name="source" ):
+        """
+        Initialise our class
+
+        @param  source  Iterable which provides the items to process
+        @type  source  iterable
+        @param  maxsize  Maximum count of items waiting between two stages
+        @type  maxsize  int
+        @param  name  Name of source stage, used for stats
+        @type  name  str
+        """
+        self.maxsize = maxsize
+        self.stages = [ Stage( name, "source", source ) ]
+
+        # Set if any stage has failed, to stop the others
+        self.abort = threading.Event()
+
+        # Exception info of first failed stage
+        self.exc_info = None
+
+    def filter( self, func, name=None ):
+        """
+        Adds a stage which only passes items for which func returns True
+        """
+        return self._add( Stage( name or func.__name__, "filter", func ) )
+
+    def map( self, func, name=None ):
+        """
+        Adds a stage which passes the return value of func for each item
+        """
+        return self._add( Stage( name or func.__name__, "map", func ) )
+
+    def sink( self, func, name=None ):
+        """
+        Adds a stage which calls func for each item and passes nothing on
+        """
+        return self._add( Stage( name or func.__name__, "sink", func ) )
+
+    def _add( self, stage ):
+        """
+        Appends stage, connected by a bounded queue to the previous one
+        """
+        if self.stages[-1].kind == "sink":
+            raise PipelineError( "Can't add stage after sink stage!" )
+
+        stage.inqueue = queue.Queue( self.maxsize )
+        self.stages[-1].outqueue = stage.inqueue
+        self.stages.append( stage )
+
+        return self
+
+    def run( self, report_interval=None ):
+        """
+        Runs all stages until source is exhausted
+
+        Re-raises the exception of the first failing stage.
+
+        @param  report_interval  If given, stats are written via
+                                 jogobot.output() every n seconds
+        @type  report_interval  int
+        """
+        # Items of last stage if it is not a sink are just discarded
+        if self.stages[-1].kind != "sink":
+            self.sink( lambda item: None, name="discard" )
+
+        threads = [ threading.Thread( target=self._work, args=( stage, ),
+                                      name="pipeline-" + stage.name,
+                                      daemon=True )
+                    for stage in self.stages ]
+
+        for thread in threads:
+            thread.start()
+
+        # Wait for stages, reporting periodically if requested
+        for thread in threads:
+            while thread.is_alive():
+                thread.join( report_interval )
+
+                if report_interval and thread.is_alive():
+                    self.report()
+
+        if self.exc_info:
+            raise self.exc_info[1].with_traceback( self.exc_info[2] )
+
+        if report_interval:
+            self.report()
+
+    def _work( self, stage ):
+        """
+        Thread target, processes items of one stage
+        """
+        stage.started = time.monotonic()
+
+        try:
+            if stage.kind == "source":
+                items = iter( stage.func )
+            else:
+                items = self._get( stage.inqueue )
+
+            for item in items:
+                stage.processed += 1
+
+                if stage.kind == "filter":
+                    if not stage.func( item ):
+                        continue
+                elif stage.kind == "map":
+                    item = stage.func( item )
+                elif stage.kind == "sink":
+                    stage.func( item )
+                    continue
+
+                self._put( stage.outqueue, item )
+
+            # Signal end of items to following stage
+            if stage.outqueue is not None:
+                self._put( stage.outqueue, _END )
+
+        except:
+            # Only keep first exception, others are consequences
+            if not self.abort.is_set():
+                self.exc_info = sys.exc_info()
+                self.abort.set()
+        finally:
+            stage.finished = time.monotonic()
+
+    def _get( self, inqueue ):
+        """
+        Yields items from inqueue until end marker, aborts if requested
+        """
+        while not self.abort.is_set():
+            try:
+                item = inqueue.get( timeout=0.1 )
+            except queue.Empty:
+                continue
+
+            if item is _END:
+                return
+
+            yield item
+
+    def _put( self, outqueue, item ):
+        """
+        Puts item to outqueue, blocks while full unless abort is requested
+        """
+        while not self.abort.is_set():
+            try:
+                outqueue.put( item, timeout=0.1 )
+            except queue.Full:
+                continue
+            else:
+                return
+
+        raise PipelineError( "Pipeline aborted!" )
+
+    def stats( self ):
+        """
+        Returns current stats for each stage
+
+        @return  List of dicts with keys name, kind, processed, queue (count
+                 of items waiting in input queue), rate (items per second)
+        @rtype  list
+        """
+        return [ stage.stats() for stage in self.stages ]
+
+    def report( self ):
+        """
+        Writes current stats of each stage via jogobot.output()
+        """
+        for stats in self.stats():
+            jogobot.output( (
+                "Pipeline stage \"{name}\" ({kind}): {processed} items, " +
+                "{rate:.1f}/s, queue {queue}" ).format( **stats ) )
+
+
+class Stage:
+    """
+    Single pipeline stage with its metrics
+    """
+
+    def __init__( self, name, kind, func ):
+        """
+        Initialise our class
+        """
+        self.name = name
+        self.kind = kind
+        self.func = func
+
+        self.inqueue = None
+        self.outqueue = None
+
+        self.processed = 0
+        self.started = None
+        self.finished = None
+
+    def stats( self ):
+        """
+        Returns current stats of this stage
+
+        @rtype  dict
+        """
+        if self.started is None:
+            rate = 0.0
+        else:
+            elapsed = ( self.finished or time.monotonic() ) - self.started
+            rate = self.processed / elapsed if elapsed else 0.0
+
+        return { "name": self.name,
+                 "kind": self.kind,
+                 "processed": self.processed,
+                 "queue": self.inqueue.qsize() if self.inqueue else 0,
+                 "rate": rate }
+
+
+class PipelineError( Exception ):
+    """
+    Raised on errors in pipeline setup or if pipeline was aborted
+    """
+    pass
+
+
+# Marks end of items in queues
+_END = object()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  records.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Compact records for per-page task state and results
+
+Run this module directly for a memory benchmark with 1M records.
+"""
+
+import csv
+import sys
+from array import array
+
+
+class PageRecord:
+    """
+    State and result of a single processed page
+
+    Uses __slots__, so it needs much less memory than a dict per page.
+    """
+
+    __slots__ = ( "title", "revid", "flags", "result" )
+
+    def __init__( self, title, revid=0, flags=0, result=None ):
+        """
+        Initialise our class
+
+        @param  title  Page title
+        @type  title  str
+        @param  revid  Revision id the page was processed with
+        @type  revid  int
+        @param  flags  Task specific bit flags
+        @type  flags  int
+        @param  result  Short result code (e.g. "saved", "skipped")
+        @type  result  str
+        """
+        self.title = title
+        self.revid = revid
+        self.flags = flags
+        self.result = result
+
+    def __repr__( self ):
+        return "PageRecord({title!r}, {revid!r}, {flags!r}, {result!r})".\
+            format( title=self.title, revid=self.revid, flags=self.flags,
+                    result=self.result )
+
+    def __eq__( self, other ):
+        if not isinstance( other, PageRecord ):
+            return NotImplemented
+
+        return ( ( self.title, self.revid, self.flags, self.result ) ==
+                 ( other.title, other.revid, other.flags, other.result ) )
+
+    def __hash__( self ):
+        return hash( ( self.title, self.revid, self.flags, self.result ) )
+
+
+class RecordAccumulator:
+    """
+    Columnar store for PageRecords
+
+    Revids and flags are kept in typed arrays, result codes are interned.
+    If a path is given, records are appended to this file (tab separated)
+    every time chunk_size records are collected, so memory stays bounded.
+    An existing file is truncated on the first dump of an accumulator.
+    """
+
+    def __init__( self, path=None, chunk_size=100000 ):
+        """
+        Initialise our class
+
+        @param  path  File to dump chunks to, None to keep all in memory
+        @type  path  str
+        @param  chunk_size  Count of records to collect before dumping
+        @type  chunk_size  int
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+
+        # Count of records already dumped to file
+        self.dumped = 0
+
+        self._clear()
+
+    def _clear( self ):
+        """
+        Empties in memory columns
+        """
+        self.titles = []
+        self.revids = array( "q" )
+        self.flags = array( "q" )
+        self.results = []
+
+    def add( self, title, revid=0, flags=0, result=None ):
+        """
+        Adds a record given by its fields
+
+        @param  title  Page title
+        @type  title  str
+        @param  revid  Revision id the page was processed with
+        @type  revid  int
+        @param  flags  Task specific bit flags
+        @type  flags  int
+        @param  result  Short result code (e.g. "saved", "skipped")
+        @type  result  str
+
+        @raises  ValueError  If revid or flags do not fit in 64 bit
+        """
+        for name, value in ( ( "revid", revid ), ( "flags", flags ) ):
+            if value and not -2**63 <= value < 2**63:
+                raise ValueError( ( "Value {value} of {name} does not fit " +
+                                    "in 64 bit!" ).format( value=value,
+                                                          name=name ) )
+
+        self.titles.append( title )
+        self.revids.append( revid or 0 )
+        self.flags.append( flags or 0 )
+        self.results.append( sys.intern( result ) if result else None )
+
+        if self.path and len( self.titles ) >= self.chunk_size:
+            self.dump()
+
+    def append( self, record ):
+        """
+        Adds a PageRecord, could be used as pipeline sink
+
+        @param  record  Record to add
+        @type  record  PageRecord
+        """
+        self.add( record.title, record.revid, record.flags, record.result )
+
+    def __len__( self ):
+        """
+        Returns count of records kept in memory (not the dumped ones)
+        """
+        return len( self.titles )
+
+    @property
+    def total( self ):
+        """
+        Returns count of all records, including dumped ones
+        """
+        return self.dumped + len( self.titles )
+
+    def __iter__( self ):
+        """
+        Yields PageRecords kept in memory (not the dumped ones)
+        """
+        for index in range( len( self.titles ) ):
+            yield self[index]
+
+    def __getitem__( self, index ):
+        """
+        Returns PageRecord at given index of records kept in memory
+        """
+        return PageRecord( self.titles[index], self.revids[index],
+                           self.flags[index], self.results[index] )
+
+    def dump( self ):
+        """
+        Appends records kept in memory to file and frees them
+        """
+        if not self.path:
+            raise ValueError( "No path to dump records to was provided!" )
+
+        # Do not mix records of previous runs with ours
+        mode = "a" if self.dumped else "w"
+
+        with open( self.path, mode, newline="" ) as fd:
+            writer = csv.writer( fd, delimiter="\t" )
+            writer.writerows( zip( self.titles, self.revids, self.flags,
+                                   ( result or "" for result in
+                                     self.results ) ) )
+
+        self.dumped += len( self.titles )
+        self._clear()
+
+    @staticmethod
+    def load( path ):
+        """
+        Yields PageRecords from a file written by dump()
+
+        @param  path  File to read records from
+        @type  path  str
+        """
+        with open( path, newline="" ) as fd:
+            for title, revid, flags, result in csv.reader( fd,
+                                                           delimiter="\t" ):
+                yield PageRecord( title, int( revid ), int( flags ),
+                                  result or None )
+
+
+def benchmark( count=1000000 ):
+    """
+    Compares memory usage of dicts, PageRecords and RecordAccumulator
+
+    @param  count  Count of records to create
+    @type  count  int
+    """
+    import tracemalloc
+
+    def measure( factory ):
+        tracemalloc.start()
+        data = factory()  # noqa, keep data alive while measuring
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    # Titles are needed in all cases, so don't count them
+    titles = [ "Page %d" % index for index in range( count ) ]
+
+    def dicts():
+        return [ { "title": title, "revid": index, "flags": 0,
+                   "result": "saved" }
+                 for index, title in enumerate( titles ) ]
+
+    def records():
+        return [ PageRecord( title, index, 0, "saved" )
+                 for index, title in enumerate( titles ) ]
+
+    def accumulator():
+        acc = RecordAccumulator()
+        for index, title in enumerate( titles ):
+            acc.add( title, index, 0, "saved" )
+        return acc
+
+    for name, factory in ( ( "dict", dicts ), ( "PageRecord", records ),
+                           ( "RecordAccumulator", accumulator ) ):
+        size = measure( factory )
+        print( "{name:<20} {size:>8.1f} MiB  {per:>6.1f} B/record".format(
+            name=name, size=size / 2**20, per=size / count ) )
+
+
+if __name__ == "__main__":
+    benchmark()
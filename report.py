@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  report.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Collects outcomes of a run and publishes them at the end as one status
+page edit and one digest mail
+
+Usage in task:
+    jogobot.report.start( task_slug )
+    if jogobot.bot.active( task_slug ):
+        ...
+    jogobot.report.publish()
+
+As long as no report was started, outcomes are dropped and StatusAPI sends
+its mails immediately as before.
+"""
+
+import sys
+from datetime import datetime
+
+import pywikibot
+
+from jogobot.config import config
+from jogobot.records import RecordAccumulator
+
+
+class Outcome:
+    """
+    Outcome of a single (sub)task
+    """
+
+    __slots__ = ( "time", "subtask", "outcome", "message" )
+
+    def __init__( self, subtask, outcome, message="" ):
+        """
+        Initialise our class
+
+        @param  subtask  Slug of subtask, None for whole task
+        @type  subtask  str
+        @param  outcome  Short outcome, e.g. "finished", "failed"
+        @type  outcome  str
+        @param  message  Additional details
+        @type  message  str
+        """
+        self.time = datetime.utcnow()
+        self.subtask = subtask
+        self.outcome = outcome
+        self.message = message
+
+
+class RunReport:
+    """
+    Collects outcomes and mails of a single run of a task
+    """
+
+    # Outcomes which will trigger a digest mail even without queued mails
+    failures = ( "failed", "init failed", "blocked", "disabled" )
+
+    # Outcomes which forbid editing the wiki
+    stopped = ( "blocked", "disabled" )
+
+    def __init__( self, task_slug, records_path=None ):
+        """
+        Initialise our class
+
+        @param  task_slug  Slug of task the run belongs to
+        @type  task_slug  str
+        @param  records_path  File to dump per page results to, None to keep
+                              them in memory
+        @type  records_path  str
+        """
+        self.task_slug = task_slug
+        self.outcomes = []
+
+        # Per page results of run and count of each result
+        self.pages = RecordAccumulator( records_path )
+        self.page_results = dict()
+
+        # List of tuples ( subject, body, to )
+        self.mails = []
+
+    def add( self, subtask, outcome, message="" ):
+        """
+        Adds outcome of subtask
+        """
+        self.outcomes.append( Outcome( subtask, outcome, message ) )
+
+    def record( self, title, revid=0, flags=0, result=None ):
+        """
+        Adds result of a single processed page
+        """
+        self.pages.add( title, revid, flags, result )
+        self.page_results[result] = self.page_results.get( result, 0 ) + 1
+
+    def summary( self ):
+        """
+        Returns count of pages per result as single line, empty if no page
+        results were recorded
+
+        @rtype  str
+        """
+        if not self.page_results:
+            return ""
+
+        return "Pages: " + ", ".join(
+            "{result}: {count}".format( result=result or "none",
+                                        count=count )
+            for result, count in sorted( self.page_results.items(),
+                                         key=lambda item: str( item[0] ) ) )
+
+    def queue_mail( self, subject, body, to ):
+        """
+        Queues mail to be included in digest
+        """
+        self.mails.append( ( subject, body, to ) )
+
+    def wikitext( self ):
+        """
+        Returns outcomes formatted as wikitable
+
+        @rtype  str
+        """
+        lines = [ "{| class=\"wikitable\"",
+                  "! Time (UTC) !! Subtask !! Outcome !! Message" ]
+
+        for outcome in self.outcomes:
+            lines.append( "|-" )
+            lines.append( "| {time} || {subtask} || {outcome} || "
+                          "<nowiki>{message}</nowiki>".format(
+                              time=outcome.time.strftime(
+                                  config["log_timestamp"] ),
+                              subtask=outcome.subtask or "",
+                              outcome=outcome.outcome,
+                              message=outcome.message ) )
+
+        lines.append( "|}" )
+
+        if self.page_results:
+            lines.append( "" )
+            lines.append( self.summary() )
+
+        return "\n".join( lines )
+
+    def digest( self ):
+        """
+        Returns subject, body and recipients of digest mail or None if
+        there is nothing to report
+
+        @rtype  tuple
+        """
+        failed = [ outcome for outcome in self.outcomes
+                   if outcome.outcome in type(self).failures ]
+
+        if not ( self.mails or failed ):
+            return None
+
+        subject = "JogoBot: Run report of task {task_slug}".format(
+            task_slug=self.task_slug )
+
+        body = []
+
+        for outcome in self.outcomes:
+            body.append( "{time} {subtask}: {outcome} {message}".format(
+                time=outcome.time.strftime( config["log_timestamp"] ),
+                subtask=outcome.subtask or self.task_slug,
+                outcome=outcome.outcome,
+                message=outcome.message ).rstrip() )
+
+        if self.page_results:
+            body.append( self.summary() )
+
+        for mail_subject, mail_body, to in self.mails:
+            body.append( "\n" + mail_subject + "\n" + mail_body.strip() )
+
+        # Keep order of recipients but avoid duplicates
+        recipients = []
+
+        for mail_subject, mail_body, to in self.mails:
+            for recipient in to.split( "," ):
+                if recipient.strip() not in recipients:
+                    recipients.append( recipient.strip() )
+
+        if not recipients:
+            recipients.append( "jogobot-" + self.task_slug +
+                               "-status@golderweb.de" )
+
+        return ( subject, "\n".join( body ), ", ".join( recipients ) )
+
+    def publish( self, page_title=None ):
+        """
+        Writes outcomes to status page (one edit) and sends digest mail
+
+        If the bot is blocked or disabled, only the digest mail is sent.
+
+        @param  page_title  Title of status page, default is configured
+                            "report_page" formated with task_slug
+        @type  page_title  str
+        """
+        from jogobot.jogobot import sendmail
+
+        digest = self.digest()
+
+        if digest:
+            sendmail( *digest )
+
+        if self.pages.path:
+            self.pages.dump()
+
+        stopped = any( outcome.outcome in type(self).stopped
+                       for outcome in self.outcomes )
+
+        if ( self.outcomes or self.page_results ) and not stopped:
+            if not page_title:
+                page_title = config.get(
+                    "report_page", "Benutzer:JogoBot/{task_slug}/status" )
+
+            page = pywikibot.Page( pywikibot.Site(),
+                                   page_title.format(
+                                       task_slug=self.task_slug ) )
+            page.text = self.wikitext()
+            page.save( summary="Bot: Update run report" )
+
+        self.outcomes = []
+        self.mails = []
+
+
+# Report of current run, None if collecting is not started
+collector = None
+
+
+def start( task_slug, records_path=None ):
+    """
+    Starts collecting outcomes for task_slug
+
+    @param  records_path  File to dump per page results to
+    @type  records_path  str
+
+    @return  Report of current run
+    @rtype  RunReport
+    """
+    global collector
+
+    collector = RunReport( task_slug, records_path )
+
+    return collector
+
+
+def add( subtask, outcome, message="" ):
+    """
+    Adds outcome to current report, if started
+    """
+    if collector:
+        collector.add( subtask, outcome, message )
+
+
+def record( title, revid=0, flags=0, result=None ):
+    """
+    Adds result of a single processed page to current report, if started
+    """
+    if collector:
+        collector.record( title, revid, flags, result )
+
+
+def queue_mail( subject, body, to ):
+    """
+    Queues mail for digest of current report, if started
+
+    @return  True if queued, False if mail has to be sent directly
+    @rtype  bool
+    """
+    if collector:
+        collector.queue_mail( subject, body, to )
+        return True
+
+    return False
+
+
+def publish( page_title=None ):
+    """
+    Publishes and ends current report, if started
+    """
+    global collector
+
+    if collector:
+        report, collector = collector, None
+        report.publish( page_title )
+
+
+def publish_at_exit():
+    """
+    Makes sure queued mails are not lost if task did not publish
+
+    Called by jogobot.jogobot.run_exit_hooks(), errors are only logged.
+    """
+    try:
+        publish()
+    except:
+        (type, value, traceback) = sys.exc_info()
+        from jogobot.jogobot import output
+        output( "\03{red} Error while publishing run report: %s (%s)" %
+                ( value, type ), "ERROR" )
+
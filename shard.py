@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8  -*-
+#
+#  shard.py
+#
+#  Copyright 2016 Jonathan Golder <jonathan@golderweb.de>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+"""
+Split page generators across several processes or hosts
+
+Either statically (each process gets shard i of n by title hash, works
+across hosts) or dynamically via a job queue in a local SQLite file, where
+the first worker fills in the page titles and all workers on the same host
+lease chunks of them.
+"""
+
+import os
+import zlib
+import socket
+
+import pywikibot
+from pywikibot import pagegenerators
+
+import jogobot
+from jogobot.jobqueue import JobQueue  # noqa
+
+
+def parse_shard( value ):
+    """
+    Parses value of "-shard:i/n" arg
+
+    @param  value  Value like "0/4" (zero-based index / count of shards)
+    @type  value  str
+
+    @return  Tuple of index and count
+    @rtype  tuple
+    """
+    index, sep, count = value.partition( "/" )
+
+    try:
+        index, count = int( index ), int( count )
+    except ValueError:
+        raise ValueError( ( "Invalid shard \"{value}\", expected " +
+                            "\"index/count\"!" ).format( value=value ) )
+
+    if not 0 <= index < count:
+        raise ValueError( ( "Invalid shard \"{value}\", index must be " +
+                            "between 0 and count - 1!" ).format(
+                                value=value ) )
+
+    return ( index, count )
+
+
+def shard_of( page, count ):
+    """
+    Returns shard of given page, determined by a hash of its title
+
+    Page id is not used, as loading it would need an API request per page
+    in each of the shard processes.
+
+    @param  page  Page to get shard for
+    @type  page  pywikibot.Page
+    @param  count  Count of shards
+    @type  count  int
+
+    @rtype  int
+    """
+    return zlib.crc32( page.title().encode( "utf-8" ) ) % count
+
+
+def shard_generator( generator, index, count ):
+    """
+    Yields only pages of generator belonging to shard index of count
+
+    @param  generator  Generator yielding pywikibot.Page objects
+    @type  generator  iterable
+    @param  index  Zero-based index of shard
+    @type  index  int
+    @param  count  Count of shards
+    @type  count  int
+    """
+    for page in generator:
+        if shard_of( page, count ) == index:
+            yield page
+
+
+class ShardedGeneratorFactory( pagegenerators.GeneratorFactory ):
+    """
+    GeneratorFactory which restricts the combined generator to a shard or
+    takes pages from a JobQueue if configured
+    """
+
+    # Tuple of shard index and count, None for all pages
+    shard = None
+
+    # JobQueue to lease pages from, None to use own generator only
+    jobqueue = None
+
+    def getCombinedGenerator( self, *args, **kwargs ):
+        """
+        Returns combined generator of pagegenerators.GeneratorFactory,
+        restricted to shard and/or replaced by JobQueue
+        """
+        generator = super().getCombinedGenerator( *args, **kwargs )
+
+        if generator is not None and self.shard:
+            generator = shard_generator( generator, *self.shard )
+
+        if self.jobqueue:
+            generator = self._jobqueue_generator( generator )
+
+        return generator
+
+    def _jobqueue_generator( self, generator ):
+        """
+        Fills jobqueue with generator if this is the first worker and
+        yields pages leased from jobqueue
+        """
+        worker = "{host}:{pid}".format( host=socket.gethostname(),
+                                        pid=os.getpid() )
+
+        if generator is None:
+            if not self.jobqueue.is_filled():
+                jogobot.output( (
+                    "Worker has no pages to fill job queue " +
+                    "\"{path}\", waiting for filling worker" ).format(
+                        path=self.jobqueue.path ), "WARNING" )
+
+        elif self.jobqueue.claim_filling( worker ):
+            self.jobqueue.fill( page.title() for page in generator )
+
+        site = pywikibot.Site()
+
+        for title in self.jobqueue.titles( worker ):
+            yield pywikibot.Page( site, title )